@@ -1,4 +1,6 @@
 import os
+import sys
+import logging
 import shutil
 from datetime import datetime
 from PIL import Image
@@ -6,106 +8,218 @@ from PIL.ExifTags import TAGS
 import pathlib
 import re
 import json
+import struct
 
-def get_date_from_filename(filename):
+log = logging.getLogger(__name__)
+
+# orjson parses metadata files considerably faster; fall back to the standard library
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Precompiled patterns for extracting dates from filenames
+_TS_PREFIX = re.compile(r'^\d+_')
+_DATE8 = re.compile(r'(\d{8})')
+
+# Supported file extensions (images and videos)
+_SUPPORTED_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.mp4', '.heic', '.mov', '.dng'})
+
+# File types that can carry EXIF data, and the IFD0 tag pointing to the Exif sub-IFD
+_EXIF_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.tif', '.tiff', '.dng'})
+_EXIF_IFD_POINTER = 0x8769
+_JPEG_EXTENSIONS = frozenset({'.jpg', '.jpeg'})
+_DATETIME_ORIGINAL = 0x9003
+
+def get_date_from_filename(filename, current_year=None):
     # Look for date pattern YYYYMMDD in filename
-    date_pattern = r'(\d{8})'
-    match = re.search(date_pattern, filename)
+    if current_year is None:
+        current_year = datetime.now().year
+    match = _DATE8.search(filename)
     if match:
         date_str = match.group(1)
         try:
-            date = datetime.strptime(date_str, '%Y%m%d')
+            # The regex guarantees 8 digits, so slice them instead of using strptime
+            date = datetime(int(date_str[0:4]), int(date_str[4:6]), int(date_str[6:8]))
             # Validate the date is reasonable (between 1900 and current year)
-            if 1900 <= date.year <= datetime.now().year:
+            if 1900 <= date.year <= current_year:
                 return date
         except ValueError:
             return None
     return None
 
-def get_date_from_json(image_path):
+def get_date_from_json(image_path, names=None, current_year=None):
     # Try to find and read the corresponding JSON file
+    # names optionally holds the casefolded file names in the image's folder (from os.scandir)
+    # so candidates that can't exist there are skipped without a system call
+    # Candidates are (folder, file name) strings; a path is only built for files that get opened
+    parent = str(image_path.parent)
+    stem = image_path.stem
+    # The exact name main.py writes ("<name>.json") comes first, whatever the extension's case
+    candidates = [(parent, image_path.name + '.json')]
     # Try different possible JSON file extensions
-    possible_json_extensions = [
-        image_path.with_suffix('.jpg.json'),
-        image_path.with_suffix('.jpeg.json'),
-        image_path.with_suffix('.png.json'),
-        image_path.with_suffix('.gif.json'),
-        image_path.with_suffix('.mp4.json'),
-        image_path.with_suffix('.mov.json'),
-        image_path.with_suffix('.heic.json'),
-        image_path.with_suffix('.bmp.json'),
-        image_path.with_suffix('.dng.json'),
-        image_path.with_suffix('.json')
-    ]
+    candidates.extend((parent, stem + suffix) for suffix in (
+        '.jpg.json',
+        '.jpeg.json',
+        '.png.json',
+        '.gif.json',
+        '.mp4.json',
+        '.mov.json',
+        '.heic.json',
+        '.bmp.json',
+        '.dng.json',
+        '.json'
+    ))
     
     # Also try looking for JSON with the original filename (without timestamp)
-    original_name = re.sub(r'^\d+_', '', image_path.name)
-    original_path = image_path.with_name(original_name)
-    possible_json_extensions.extend([
-        original_path.with_suffix('.json'),
-        original_path.with_suffix('.dng.json'),
-        original_path.with_suffix('.jpeg.json'),
-        original_path.with_suffix('.jpg.json')
-    ])
+    original_stem = os.path.splitext(_TS_PREFIX.sub('', image_path.name))[0]
+    candidates.extend((parent, original_stem + suffix) for suffix in (
+        '.json',
+        '.dng.json',
+        '.jpeg.json',
+        '.jpg.json'
+    ))
     
-    # Also check in the output folder for JSON files
-    output_dir = pathlib.Path("output")
-    if output_dir.exists():
-        output_json = output_dir / image_path.name
-        possible_json_extensions.extend([
-            output_json.with_suffix('.json'),
-            output_json.with_suffix('.jpg.json'),
-            output_json.with_suffix('.jpeg.json'),
-            output_json.with_suffix('.heic.json'),
-            output_json.with_suffix('.mp4.json'),
-            output_json.with_suffix('.mov.json'),
-            output_json.with_suffix('.png.json'),
-            output_json.with_suffix('.gif.json'),
-            output_json.with_suffix('.bmp.json'),
-            output_json.with_suffix('.dng.json')
-        ])
+    # Also check in the output folder for JSON files; images already in it (as when called from
+    # create_date_folders) were covered above, so skip the existence check for them
+    output_dir = "output"
+    if os.path.normpath(parent) != output_dir and os.path.exists(output_dir):
+        candidates.extend((output_dir, stem + suffix) for suffix in (
+            '.json',
+            '.jpg.json',
+            '.jpeg.json',
+            '.heic.json',
+            '.mp4.json',
+            '.mov.json',
+            '.png.json',
+            '.gif.json',
+            '.bmp.json',
+            '.dng.json'
+        ))
     
-    for json_path in possible_json_extensions:
-        if json_path.exists():
-            try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                    photo_taken_time = metadata.get("photoTakenTime", {})
-                    timestamp = photo_taken_time.get("timestamp")
-                    if timestamp:
-                        date = datetime.fromtimestamp(int(timestamp))
-                        # Validate the date is reasonable (between 1900 and current year)
-                        if 1900 <= date.year <= datetime.now().year:
-                            return date
-            except Exception as e:
-                print(f"Error reading JSON data from {json_path}: {e}")
+    if current_year is None:
+        current_year = datetime.now().year
+    # The lists overlap (e.g. for files already in the output folder), so try each file once
+    for folder, name in dict.fromkeys(candidates):
+        # Names in the indexed folder are checked in memory; the casefolded set only rules out
+        # files that are missing whatever the filesystem's case rules, open() decides the rest
+        if names is not None and folder == parent and name.casefold() not in names:
+            continue
+        json_path = os.path.join(folder, name)
+        try:
+            with open(json_path, 'rb') as f:
+                metadata = _loads(f.read())
+                photo_taken_time = metadata.get("photoTakenTime", {})
+                timestamp = photo_taken_time.get("timestamp")
+                if timestamp:
+                    date = datetime.fromtimestamp(int(timestamp))
+                    # Validate the date is reasonable (between 1900 and current year)
+                    if 1900 <= date.year <= current_year:
+                        return date
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            log.error(f"Error reading JSON data from {json_path}: {e}")
+    return None
+
+def _find_ifd_entry(tiff, endian, offset, wanted_tag):
+    # Returns (type, count, raw 4-byte value) of a tag in the IFD at offset, or None
+    entry_count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    for i in range(entry_count):
+        tag, value_type, count, value = struct.unpack_from(endian + 'HHI4s', tiff, offset + 2 + 12 * i)
+        if tag == wanted_tag:
+            return value_type, count, value
     return None
 
-def get_date_taken(image_path):
-    # First try to get date from EXIF data (only for formats that support EXIF)
-    try:
-        image = Image.open(image_path)
-        # Only try to get EXIF data for formats that support it
-        if image.format in ['JPEG', 'TIFF', 'DNG'] or image_path.suffix.lower() in ['.jpg', '.jpeg', '.dng']:
-            exif = image._getexif()
-            if exif is not None:
-                for tag_id in exif:
-                    tag = TAGS.get(tag_id, tag_id)
-                    if tag == 'DateTimeOriginal':
-                        date = datetime.strptime(exif[tag_id], '%Y:%m:%d %H:%M:%S')
-                        # Validate the date is reasonable (between 1900 and current year)
-                        if 1900 <= date.year <= datetime.now().year:
-                            return date
-    except Exception as e:
-        print(f"Error reading EXIF data from {image_path}: {e}")
+def _fast_jpeg_datetime(image_path):
+    # Read DateTimeOriginal straight from the JPEG's APP1 (Exif) segment without decoding the image
+    # Returns None if the file has no such tag; raises ValueError/struct.error if it can't be parsed
+    with open(image_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            raise ValueError("Not a JPEG file")
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ValueError("Invalid JPEG marker")
+            # Start of scan or end of image: no metadata segments follow
+            if marker[1] in (0xDA, 0xD9):
+                return None
+            length = struct.unpack('>H', f.read(2))[0]
+            if marker[1] == 0xE1:
+                segment = f.read(length - 2)
+                if segment.startswith(b'Exif\x00\x00'):
+                    break
+            else:
+                f.seek(length - 2, os.SEEK_CUR)
     
-    # If EXIF data is not available or invalid, try to get date from JSON
-    json_date = get_date_from_json(image_path)
+    # The segment holds a TIFF structure: byte order, magic number, then the offset of IFD0
+    tiff = segment[6:]
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        raise ValueError("Invalid TIFF header")
+    ifd0_offset = struct.unpack_from(endian + 'I', tiff, 4)[0]
+    pointer = _find_ifd_entry(tiff, endian, ifd0_offset, _EXIF_IFD_POINTER)
+    if pointer is None:
+        return None
+    exif_offset = struct.unpack(endian + 'I', pointer[2])[0]
+    entry = _find_ifd_entry(tiff, endian, exif_offset, _DATETIME_ORIGINAL)
+    if entry is None:
+        return None
+    value_type, count, value = entry
+    if count > 4:
+        value_offset = struct.unpack(endian + 'I', value)[0]
+        value = tiff[value_offset:value_offset + count]
+    return value[:count].rstrip(b'\x00').decode('latin-1')
+
+def _pillow_datetime(image_path):
+    # Read DateTimeOriginal through Pillow, for files the fast parser can't handle
+    with Image.open(image_path) as image:
+        # DateTimeOriginal is stored in the Exif sub-IFD, not in IFD0
+        exif = image.getexif().get_ifd(_EXIF_IFD_POINTER)
+        for tag_id in exif:
+            tag = TAGS.get(tag_id, tag_id)
+            if tag == 'DateTimeOriginal':
+                return exif[tag_id]
+    return None
+
+def get_date_taken(image_path, names=None, current_year=None):
+    # current_year is computed once by the caller when processing many files
+    if current_year is None:
+        current_year = datetime.now().year
+    # First try to get date from the JSON metadata; Google Takeout writes one for nearly
+    # every file and it is cheaper to read than the image itself
+    json_date = get_date_from_json(image_path, names, current_year)
     if json_date:
         return json_date
     
-    # If JSON date is not available, try to get date from filename
-    return get_date_from_filename(image_path.name)
+    # If JSON date is not available, try EXIF data (only for formats that support EXIF)
+    # Other formats are skipped without opening the file at all
+    suffix = image_path.suffix.lower()
+    if suffix in _EXIF_EXTENSIONS:
+        try:
+            if suffix in _JPEG_EXTENSIONS:
+                try:
+                    date_str = _fast_jpeg_datetime(image_path)
+                except (ValueError, struct.error):
+                    date_str = _pillow_datetime(image_path)
+            else:
+                date_str = _pillow_datetime(image_path)
+            if date_str:
+                # EXIF dates are fixed-width 'YYYY:MM:DD HH:MM:SS', so slice them instead of using strptime
+                date = datetime(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]),
+                                int(date_str[11:13]), int(date_str[14:16]), int(date_str[17:19]))
+                # Validate the date is reasonable (between 1900 and current year)
+                if 1900 <= date.year <= current_year:
+                    return date
+        except Exception as e:
+            log.error(f"Error reading EXIF data from {image_path}: {e}")
+    
+    # If EXIF data is not available or invalid, try to get date from filename
+    return get_date_from_filename(image_path.name, current_year)
 
 def create_date_folders():
     # Get the output directory path
@@ -113,39 +227,49 @@ def create_date_folders():
     
     # Check if output directory exists
     if not output_dir.exists():
-        print("Output directory not found!")
+        log.error("Output directory not found!")
         return
     
-    # Define supported file extensions (images and videos)
-    supported_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.mp4', '.heic', '.mov', '.dng'}
+    # The current year bounds every date check, so look it up once
+    current_year = datetime.now().year
+    
+    # List the output directory once so JSON lookups can be answered from memory
+    with os.scandir(output_dir) as it:
+        entries = [entry for entry in it if entry.is_file()]
+    names = {entry.name.casefold() for entry in entries}
     
     # Process each file in the output directory
-    for file_path in output_dir.glob("*"):
-        if file_path.is_file():
-            # Skip JSON files and unsupported files
-            if file_path.suffix.lower() == '.json' or file_path.suffix.lower() not in supported_extensions:
-                continue
-                
-            # Get the date taken from the file
-            date_taken = get_date_taken(file_path)
+    created_folders = set()
+    # The loop works on plain strings; a Path is only built for get_date_taken
+    output_dir_str = str(output_dir)
+    for entry in entries:
+        name = entry.name
+        # Skip JSON files and unsupported files
+        if os.path.splitext(name)[1].lower() not in _SUPPORTED_EXTENSIONS:
+            continue
             
-            if date_taken:
-                # Create year and month folders
-                year_folder = output_dir / str(date_taken.year)
-                month_folder = year_folder / f"{date_taken.month:02d}"
-                
-                # Create folders if they don't exist
-                year_folder.mkdir(exist_ok=True)
-                month_folder.mkdir(exist_ok=True)
-                
-                # Move the file to the month folder
-                try:
-                    shutil.move(str(file_path), str(month_folder / file_path.name))
-                    print(f"Moved {file_path.name} to {month_folder}")
-                except Exception as e:
-                    print(f"Error moving {file_path.name}: {e}")
-            else:
-                print(f"Could not get date taken for {file_path.name}")
+        # Get the date taken from the file
+        date_taken = get_date_taken(pathlib.Path(entry.path), names, current_year)
+        
+        if date_taken:
+            # Year and month folders
+            month_folder = os.path.join(output_dir_str, str(date_taken.year), f"{date_taken.month:02d}")
+            
+            # Create folders if they don't exist (once per month folder)
+            folder_key = (date_taken.year, date_taken.month)
+            if folder_key not in created_folders:
+                os.makedirs(month_folder, exist_ok=True)
+                created_folders.add(folder_key)
+            
+            # Move the file to the month folder
+            try:
+                shutil.move(entry.path, os.path.join(month_folder, name))
+                log.info(f"Moved {name} to {month_folder}")
+            except Exception as e:
+                log.error(f"Error moving {name}: {e}")
+        else:
+            log.warning(f"Could not get date taken for {name}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
     create_date_folders()
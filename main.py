@@ -1,73 +1,172 @@
 import os
+import sys
+import logging
 import json
 import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import re
+from bisect import bisect_left
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 import piexif
 from datetime import datetime
 
+log = logging.getLogger(__name__)
+
+# orjson parses metadata files considerably faster; fall back to the standard library
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Media file types merged with their metadata
+_MEDIA_EXTENSIONS = frozenset({".jpg", ".png", ".gif", ".heic", ".mp4", ".mov", ".bmp", ".jpeg", ".dng"})
+
+# Precompiled patterns used when matching media files to their JSON metadata
+_PAREN_NUM = re.compile(r"\(\d+\)")
+_DATE_FMT = re.compile(r"(\d{4})-(\d{2})-(\d{2})\s+(\d{2})\.(\d{2})\.(\d{2})")
+_PAREN_NUM_END = re.compile(r"\(\d+\)$")
+_DATETIME = re.compile(r"(\d{8}_\d{6})")
+_DATETIME_ALL = re.compile(r"(?=(\d{8}_\d{6}))")  # overlapping matches
+_CLEAN = re.compile(r"\(\d+\)|-\w+$|_\w+$")
+
 def normalize_filename(name):
     """Removes (x) numbering and -edited suffix from filenames to enable better matching."""
     # Remove (x) numbering
-    name = re.sub(r"\(\d+\)", "", name)
+    name = _PAREN_NUM.sub("", name)
     # Remove -edited suffix
-    name = re.sub(r"-edited$", "", name)
+    if name.endswith("-edited"):
+        name = name[:-7]
     # Remove _p suffix
-    name = re.sub(r"_p$", "", name)
+    if name.endswith("_p"):
+        name = name[:-2]
     # Remove spaces and dots from date format
-    name = re.sub(r"(\d{4})-(\d{2})-(\d{2})\s+(\d{2})\.(\d{2})\.(\d{2})", r"\1\2\3_\4\5\6", name)
-    # Remove any remaining spaces
-    name = re.sub(r"\s+", "", name)
-    # Remove any remaining dots
-    name = re.sub(r"\.", "", name)
+    name = _DATE_FMT.sub(r"\1\2\3_\4\5\6", name)
+    # Remove any remaining whitespace and dots
+    name = "".join(name.split()).replace(".", "")
     # Remove any remaining underscores at the end
-    name = re.sub(r"_+$", "", name)
+    name = name.rstrip("_")
     return name
 
-def find_json_for_photo(photo_path, json_files):
+def build_json_index(json_files):
+    """Precomputes the lookup keys for every JSON file so matching a photo doesn't rescan the list."""
+    json_index = {"files": json_files, "stems": [], "normalized": {}, "without_number": {},
+                  "date": {}, "clean": {}}
+    for position, json_file in enumerate(json_files):
+        json_index["stems"].append((json_file.stem, position))
+        json_base = normalize_filename(json_file.stem)
+        # setdefault keeps the first JSON file in list order for each key
+        json_index["normalized"].setdefault(json_base, json_file)
+        json_index["without_number"].setdefault(_PAREN_NUM_END.sub("", json_base), json_file)
+        for date_str in _DATETIME_ALL.findall(json_base):
+            json_index["date"].setdefault(date_str, json_file)
+        json_index["clean"].setdefault(_CLEAN.sub("", json_base), json_file)
+    json_index["stems"].sort()
+    return json_index
+
+def find_json_for_photo(photo_path, json_index):
     """Finds the corresponding JSON file for a given photo, handling variations in file extensions and numbering."""
     base_name = photo_path.stem  # Original filename without extension
     normalized_base = normalize_filename(base_name)
 
-    # First attempt: exact match
-    for json_file in json_files:
-        if json_file.stem.startswith(base_name):
-            return json_file
+    # First attempt: exact match (earliest JSON file whose stem starts with the photo name)
+    stems = json_index["stems"]
+    first = None
+    i = bisect_left(stems, (base_name,))
+    while i < len(stems) and stems[i][0].startswith(base_name):
+        if first is None or stems[i][1] < first:
+            first = stems[i][1]
+        i += 1
+    if first is not None:
+        return json_index["files"][first]
 
     # Second attempt: try matching after normalizing
-    for json_file in json_files:
-        json_base = normalize_filename(json_file.stem)
-        if json_base == normalized_base:
-            return json_file
+    json_file = json_index["normalized"].get(normalized_base)
+    if json_file:
+        return json_file
 
     # Third attempt: try matching without the (1) suffix
-    base_without_number = re.sub(r"\(\d+\)$", "", normalized_base)
-    for json_file in json_files:
-        json_base = normalize_filename(json_file.stem)
-        json_without_number = re.sub(r"\(\d+\)$", "", json_base)
-        if json_without_number == base_without_number:
-            return json_file
+    json_file = json_index["without_number"].get(_PAREN_NUM_END.sub("", normalized_base))
+    if json_file:
+        return json_file
 
     # Fourth attempt: try matching the base date-time pattern
-    date_pattern = re.search(r"(\d{8}_\d{6})", normalized_base)
+    date_pattern = _DATETIME.search(normalized_base)
     if date_pattern:
-        date_str = date_pattern.group(1)
-        for json_file in json_files:
-            json_base = normalize_filename(json_file.stem)
-            if date_str in json_base:
-                return json_file
+        json_file = json_index["date"].get(date_pattern.group(1))
+        if json_file:
+            return json_file
 
     # Fifth attempt: try matching without any numbering or suffixes
-    base_clean = re.sub(r"\(\d+\)|-\w+$|_\w+$", "", normalized_base)
-    for json_file in json_files:
-        json_base = normalize_filename(json_file.stem)
-        json_clean = re.sub(r"\(\d+\)|-\w+$|_\w+$", "", json_base)
-        if json_clean == base_clean:
-            return json_file
+    return json_index["clean"].get(_CLEAN.sub("", normalized_base))  # None if no match is found
 
-    return None  # Return None if no match is found
+def index_directory(directory):
+    """Lists the files in a directory once, mapping each file name to its path string."""
+    try:
+        with os.scandir(directory) as it:
+            return {entry.name: entry.path for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
+def write_jpeg_with_exif(jpeg_data, dst, exif_bytes):
+    """Writes the JPEG bytes jpeg_data to dst with exif_bytes (from piexif.dump) as its Exif segment."""
+    data = memoryview(jpeg_data)
+    if data[:2] != b'\xff\xd8':
+        raise ValueError("Not a JPEG file")
+    if len(exif_bytes) + 2 > 0xFFFF:
+        raise ValueError("EXIF data too large for a JPEG segment")
+    parts = [b'\xff\xd8\xff\xe1', struct.pack('>H', len(exif_bytes) + 2), exif_bytes]
+    offset = 2
+    while True:
+        if data[offset] != 0xFF:
+            raise ValueError("Invalid JPEG marker")
+        marker = data[offset + 1]
+        # Start of scan (or end of image): the rest of the file is copied unchanged
+        if marker in (0xDA, 0xD9):
+            parts.append(data[offset:])
+            break
+        end = offset + 2 + struct.unpack_from('>H', data, offset + 2)[0]
+        # Drop the JFIF APP0 segment and any existing Exif APP1 segment, like piexif.insert
+        is_exif = marker == 0xE1 and data[offset + 4:offset + 10] == b'Exif\x00\x00'
+        if marker != 0xE0 and not is_exif:
+            parts.append(data[offset:end])
+        offset = end
+    with open(dst, 'wb') as f:
+        f.writelines(parts)
+
+# GPS fields that are the same for every photo; get_exif_gps_dict fills in the coordinates
+_GPS_TEMPLATE = {
+    piexif.GPSIFD.GPSVersionID: (2, 2, 0, 0),
+    piexif.GPSIFD.GPSAltitudeRef: 0,
+    piexif.GPSIFD.GPSAltitude: (0, 1),
+    piexif.GPSIFD.GPSTimeStamp: ((0, 1), (0, 1), (0, 1)),
+    piexif.GPSIFD.GPSSatellites: "",
+    piexif.GPSIFD.GPSStatus: "A",
+    piexif.GPSIFD.GPSMeasureMode: "3",
+    piexif.GPSIFD.GPSDOP: (0, 1),
+    piexif.GPSIFD.GPSSpeedRef: "K",
+    piexif.GPSIFD.GPSSpeed: (0, 1),
+    piexif.GPSIFD.GPSTrackRef: "T",
+    piexif.GPSIFD.GPSTrack: (0, 1),
+    piexif.GPSIFD.GPSImgDirectionRef: "M",
+    piexif.GPSIFD.GPSImgDirection: (0, 1),
+    piexif.GPSIFD.GPSMapDatum: "WGS-84",
+    piexif.GPSIFD.GPSDestLatitudeRef: "N",
+    piexif.GPSIFD.GPSDestLatitude: ((0, 1), (0, 1), (0, 1)),
+    piexif.GPSIFD.GPSDestLongitudeRef: "E",
+    piexif.GPSIFD.GPSDestLongitude: ((0, 1), (0, 1), (0, 1)),
+    piexif.GPSIFD.GPSDestBearingRef: "M",
+    piexif.GPSIFD.GPSDestBearing: (0, 1),
+    piexif.GPSIFD.GPSDestDistanceRef: "K",
+    piexif.GPSIFD.GPSDestDistance: (0, 1),
+    piexif.GPSIFD.GPSProcessingMethod: b"",
+    piexif.GPSIFD.GPSAreaInformation: b"",
+    piexif.GPSIFD.GPSDateStamp: "",
+    piexif.GPSIFD.GPSDifferential: 0
+}
 
 def get_exif_gps_dict(lat, lon):
     """Convert latitude and longitude to EXIF GPS format."""
@@ -84,41 +183,121 @@ def get_exif_gps_dict(lat, lon):
     lat_ref = 'N' if lat >= 0 else 'S'
     lon_ref = 'E' if lon >= 0 else 'W'
     
-    gps_dict = {
-        "GPSLatitude": lat_deg,
-        "GPSLatitudeRef": lat_ref,
-        "GPSLongitude": lon_deg,
-        "GPSLongitudeRef": lon_ref,
-        "GPSVersionID": (2, 2, 0, 0),
-        "GPSAltitudeRef": 0,
-        "GPSAltitude": (0, 1),
-        "GPSTimeStamp": ((0, 1), (0, 1), (0, 1)),
-        "GPSSatellites": "",
-        "GPSStatus": "A",
-        "GPSMeasureMode": "3",
-        "GPSDOP": (0, 1),
-        "GPSSpeedRef": "K",
-        "GPSSpeed": (0, 1),
-        "GPSTrackRef": "T",
-        "GPSTrack": (0, 1),
-        "GPSImgDirectionRef": "M",
-        "GPSImgDirection": (0, 1),
-        "GPSMapDatum": "WGS-84",
-        "GPSDestLatitudeRef": "N",
-        "GPSDestLatitude": ((0, 1), (0, 1), (0, 1)),
-        "GPSDestLongitudeRef": "E",
-        "GPSDestLongitude": ((0, 1), (0, 1), (0, 1)),
-        "GPSDestBearingRef": "M",
-        "GPSDestBearing": (0, 1),
-        "GPSDestDistanceRef": "K",
-        "GPSDestDistance": (0, 1),
-        "GPSProcessingMethod": "",
-        "GPSAreaInformation": "",
-        "GPSDateStamp": "",
-        "GPSDifferential": 0
-    }
+    gps_dict = _GPS_TEMPLATE.copy()
+    gps_dict[piexif.GPSIFD.GPSLatitude] = lat_deg
+    gps_dict[piexif.GPSIFD.GPSLatitudeRef] = lat_ref
+    gps_dict[piexif.GPSIFD.GPSLongitude] = lon_deg
+    gps_dict[piexif.GPSIFD.GPSLongitudeRef] = lon_ref
     return gps_dict
 
+def process_media_file(media, json_file, output_dir):
+    """Merges a single media file with its matched JSON metadata. Runs in a worker process.
+
+    Returns the (level, message) log records for the file and whether it was processed.
+    """
+    messages = []
+    try:
+        # Opening the file doubles as the existence check (the JSON may have been removed since the scan)
+        try:
+            with open(json_file, 'rb') as f:
+                metadata = _loads(f.read())
+        except FileNotFoundError:
+            messages.append((logging.WARNING, f"No JSON metadata found for {media.name}"))
+            return messages, False
+        
+        # Get timestamp and GPS coordinates
+        photo_taken_time = metadata.get("photoTakenTime", {})
+        timestamp = photo_taken_time.get("timestamp")
+        formatted_time = photo_taken_time.get("formatted", "")
+        
+        # Convert timestamp to datetime for file creation time
+        if timestamp:
+            try:
+                # Ensure timestamp is a string and convert to integer
+                timestamp_str = str(timestamp)
+                timestamp_int = int(timestamp_str)
+                # Convert Unix timestamp to datetime
+                photo_date = datetime.fromtimestamp(timestamp_int)
+                # Format for file creation time
+                creation_time = photo_date.strftime("%Y:%m:%d %H:%M:%S")
+            except (ValueError, TypeError) as e:
+                messages.append((logging.WARNING, f"Warning: Could not convert timestamp for {media.name}: {str(e)}"))
+                creation_time = formatted_time
+        else:
+            creation_time = formatted_time
+        
+        geo_data = metadata.get("geoData", {})
+        latitude = geo_data.get("latitude", 0)
+        longitude = geo_data.get("longitude", 0)
+        altitude = geo_data.get("altitude", 0)
+        
+        # Get people tags
+        people = metadata.get("people", [])
+        people_names = [person.get("name", "") for person in people]
+        
+        if timestamp:
+            new_name = f"{timestamp}_{media.name}"
+            new_media_path = os.path.join(output_dir, new_name)
+            
+            # Hard-link the JSON file before touching the media, so a failure here leaves the source intact
+            # It is copied when links aren't possible (other filesystem, FAT drives)
+            json_output_path = os.path.join(output_dir, f"{new_name}.json")
+            try:
+                os.link(json_file, json_output_path)
+            except OSError:
+                shutil.copy(json_file, json_output_path)
+            
+            moved = False
+            # If it's a JPEG, add GPS data to EXIF while copying it
+            if media.suffix.lower() in ['.jpg', '.jpeg']:
+                try:
+                    with open(media, 'rb') as f:
+                        jpeg_data = f.read()
+                    # Merge into the photo's own EXIF so orientation and camera data are kept
+                    # piexif needs numeric tag keys; dates use the EXIF 'YYYY:MM:DD HH:MM:SS' format
+                    exif_dict = piexif.load(jpeg_data)
+                    exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = creation_time
+                    exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = creation_time
+                    exif_dict["0th"][piexif.ImageIFD.DateTime] = creation_time
+                    # Takeout reports 0/0 for photos without a location; don't write that as a position
+                    if latitude or longitude:
+                        exif_dict["GPS"].update(get_exif_gps_dict(latitude, longitude))
+                    exif_bytes = piexif.dump(exif_dict)
+                    
+                    # Write the image with the new EXIF data, reading and writing it only once
+                    write_jpeg_with_exif(jpeg_data, new_media_path, exif_bytes)
+                    
+                    # Set file creation time to photo taken time
+                    try:
+                        os.utime(new_media_path, (timestamp_int, timestamp_int))
+                    except Exception as e:
+                        messages.append((logging.WARNING, f"Warning: Could not set file time for {media.name}: {str(e)}"))
+                except Exception as e:
+                    messages.append((logging.WARNING, f"Warning: Could not add EXIF data to {media.name}: {str(e)}"))
+                    # Fall back to a plain copy so the photo still reaches the output folder
+                    shutil.copy(media, new_media_path)
+            else:
+                # Move the file, copying it only when the output folder is on another filesystem
+                try:
+                    os.replace(media, new_media_path)
+                    moved = True
+                except OSError:
+                    shutil.copy(media, new_media_path)
+            
+            # Delete the original media file if it was copied; shared JSON files are removed by the caller
+            if not moved:
+                os.remove(media)
+            
+            messages.append((logging.INFO, f"Processed and deleted: {media.name} -> {new_name}"))
+            if people_names:
+                messages.append((logging.INFO, f"People in photo: {', '.join(people_names)}"))
+            return messages, True
+        else:
+            messages.append((logging.WARNING, f"Skipping {media.name}, missing timestamp metadata."))
+    except Exception as e:
+        messages.append((logging.ERROR, f"Error processing {media.name}: {str(e)}"))
+    return messages, False
+
 def process_photos_and_json(photo_dir, json_dir, output_dir):
     """Merges photos and videos with their metadata JSON files."""
     photo_dir = Path(photo_dir)
@@ -126,109 +305,55 @@ def process_photos_and_json(photo_dir, json_dir, output_dir):
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    file_extensions = ["*.jpg", "*.png", "*.gif", "*.heic", "*.mp4", "*.mov", "*.bmp", "*.jpeg", "*.dng"]
-    media_files = []
-    for ext in file_extensions:
-        media_files.extend(photo_dir.glob(ext))
-        print(f"Found {len(media_files)} files with extension {ext}")
+    # Read each directory once and filter the in-memory listing by extension;
+    # Path objects are only created for the files that are kept
+    photo_entries = index_directory(photo_dir)
+    media_files = [Path(path) for name, path in photo_entries.items()
+                   if os.path.splitext(name)[1].lower() in _MEDIA_EXTENSIONS]
+    log.info(f"Found {len(media_files)} media files")
     
     # Get JSON files from both source and output directories
-    json_files = []
-    for json_path in list(json_dir.glob("*.json")) + list(output_dir.glob("*.json")):
-        if json_path.exists():  # Only add files that actually exist
-            json_files.append(json_path)
+    json_entries = photo_entries if json_dir == photo_dir else index_directory(json_dir)
+    json_files = [Path(path) for name, path in json_entries.items() if name.endswith(".json")]
+    json_files.extend(Path(path) for name, path in index_directory(output_dir).items() if name.endswith(".json"))
+    json_index = build_json_index(json_files)
     
+    # Match every file here so the JSON index is only built once, in this process
+    tasks = []
     for media in media_files:
         try:
-            json_file = find_json_for_photo(media, json_files)
-            if json_file and json_file.exists():  # Double check the file exists
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                
-                # Get timestamp and GPS coordinates
-                photo_taken_time = metadata.get("photoTakenTime", {})
-                timestamp = photo_taken_time.get("timestamp")
-                formatted_time = photo_taken_time.get("formatted", "")
-                
-                # Convert timestamp to datetime for file creation time
-                if timestamp:
-                    try:
-                        # Ensure timestamp is a string and convert to integer
-                        timestamp_str = str(timestamp)
-                        timestamp_int = int(timestamp_str)
-                        # Convert Unix timestamp to datetime
-                        photo_date = datetime.fromtimestamp(timestamp_int)
-                        # Format for file creation time
-                        creation_time = photo_date.strftime("%Y:%m:%d %H:%M:%S")
-                    except (ValueError, TypeError) as e:
-                        print(f"Warning: Could not convert timestamp for {media.name}: {str(e)}")
-                        creation_time = formatted_time
-                else:
-                    creation_time = formatted_time
-                
-                geo_data = metadata.get("geoData", {})
-                latitude = geo_data.get("latitude", 0)
-                longitude = geo_data.get("longitude", 0)
-                altitude = geo_data.get("altitude", 0)
-                
-                # Get people tags
-                people = metadata.get("people", [])
-                people_names = [person.get("name", "") for person in people]
-                
-                if timestamp:
-                    new_name = f"{timestamp}_{media.name}"
-                    new_media_path = output_dir / new_name
-                    
-                    # Copy the file first
-                    shutil.copy(media, new_media_path)
-                    
-                    # If it's a JPEG, add GPS data to EXIF
-                    if media.suffix.lower() in ['.jpg', '.jpeg']:
-                        try:
-                            # Create EXIF data with GPS information
-                            exif_dict = {
-                                "GPS": get_exif_gps_dict(latitude, longitude),
-                                "Exif": {
-                                    "DateTimeOriginal": formatted_time,
-                                    "DateTimeDigitized": formatted_time,
-                                    "DateTime": formatted_time,
-                                },
-                                "0th": {
-                                    "DateTime": formatted_time,
-                                    "DateTimeOriginal": formatted_time,
-                                    "DateTimeDigitized": formatted_time,
-                                }
-                            }
-                            exif_bytes = piexif.dump(exif_dict)
-                            
-                            # Insert EXIF data into the image
-                            piexif.insert(exif_bytes, str(new_media_path))
-                            
-                            # Set file creation time to photo taken time
-                            try:
-                                os.utime(new_media_path, (timestamp_int, timestamp_int))
-                            except Exception as e:
-                                print(f"Warning: Could not set file time for {media.name}: {str(e)}")
-                        except Exception as e:
-                            print(f"Warning: Could not add EXIF data to {media.name}: {str(e)}")
-                    
-                    # Copy JSON file
-                    shutil.copy(json_file, output_dir / f"{new_name}.json")
-                    
-                    # Delete original files after successful processing
-                    os.remove(media)
-                    if json_file.parent == photo_dir:  # Only delete if it's in the source directory
-                        os.remove(json_file)
-                    
-                    print(f"Processed and deleted: {media.name} -> {new_name}")
-                    if people_names:
-                        print(f"People in photo: {', '.join(people_names)}")
-                else:
-                    print(f"Skipping {media.name}, missing timestamp metadata.")
+            json_file = find_json_for_photo(media, json_index)
+            if json_file:
+                tasks.append((media, json_file))
             else:
-                print(f"No JSON metadata found for {media.name}")
+                log.warning(f"No JSON metadata found for {media.name}")
+        except Exception as e:
+            log.error(f"Error processing {media.name}: {str(e)}")
+    
+    processed_json_files = set()
+    with ProcessPoolExecutor() as executor:
+        futures = [(media, json_file, executor.submit(process_media_file, media, json_file, output_dir))
+                   for media, json_file in tasks]
+        for media, json_file, future in futures:
+            # A worker that dies or fails to pickle its result must not stop the rest of the run
+            try:
+                messages, processed = future.result()
+            except Exception as e:
+                log.error(f"Error processing {media.name}: {str(e)}")
+                continue
+            for level, message in messages:
+                log.log(level, message)
+            if processed and json_file.parent == photo_dir:  # Only delete if it's in the source directory
+                processed_json_files.add(json_file)
+    
+    # Several media files can share one JSON file, so only delete it once all workers are done
+    for json_file in processed_json_files:
+        try:
+            os.remove(json_file)
         except Exception as e:
-            print(f"Error processing {media.name}: {str(e)}")
+            log.error(f"Error deleting {json_file.name}: {str(e)}")
 
 # Example Usage
-process_photos_and_json("Photos from 2024", "Photos from 2024", "output")
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    process_photos_and_json("Photos from 2024", "Photos from 2024", "output")
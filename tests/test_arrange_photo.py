@@ -0,0 +1,103 @@
+import io
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image
+
+import arrange_photo
+
+
+def write_json(path, timestamp):
+    path.write_text('{"photoTakenTime": {"timestamp": "%d"}}' % timestamp)
+
+
+def scan(folder):
+    with os.scandir(folder) as it:
+        return {entry.name.casefold() for entry in it if entry.is_file()}
+
+
+def test_json_lookup_uses_exact_sidecar_name(tmp_path):
+    image = tmp_path / "1400000000_PNG_2.PNG"
+    image.write_bytes(b"")
+    write_json(tmp_path / "1400000000_PNG_2.PNG.json", 1400000000)
+    expected = datetime.fromtimestamp(1400000000)
+    assert arrange_photo.get_date_from_json(image, scan(tmp_path)) == expected
+    assert arrange_photo.get_date_from_json(image) == expected
+
+
+def test_json_lookup_in_output_folder_skips_existence_check(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output = tmp_path / "output"
+    output.mkdir()
+    write_json(output / "1400000000_IMG.jpg.json", 1400000000)
+    monkeypatch.setattr(arrange_photo.os.path, "exists", lambda path: pytest.fail("unexpected stat of %s" % path))
+    image = Path("output", "1400000000_IMG.jpg")
+    assert arrange_photo.get_date_from_json(image, scan(output)) == datetime.fromtimestamp(1400000000)
+
+
+def test_json_index_only_skips_missing_names(tmp_path):
+    # A sidecar differing only in case is found exactly when the filesystem finds it
+    image = tmp_path / "1400000000_IMG.jpg"
+    image.write_bytes(b"")
+    write_json(tmp_path / "1400000000_IMG.JPG.json", 1400000000)
+    assert arrange_photo.get_date_from_json(image, scan(tmp_path)) == arrange_photo.get_date_from_json(image)
+
+
+def test_create_date_folders_moves_names_differing_in_case(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output = tmp_path / "output"
+    output.mkdir()
+    (output / "IMG_20200101.jpg").write_bytes(b"")
+    (output / "IMG_20200101.JPG").write_bytes(b"")
+    if len(os.listdir(output)) == 1:
+        pytest.skip("filesystem ignores case")
+
+    arrange_photo.create_date_folders()
+
+    assert sorted(os.listdir(output / "2020" / "01")) == ["IMG_20200101.JPG", "IMG_20200101.jpg"]
+
+
+def exif_segment(endian, date_taken):
+    # A minimal Exif APP1 payload: IFD0 holds only the Exif IFD pointer, which holds DateTimeOriginal
+    order = b"II" if endian == "<" else b"MM"
+    value = date_taken.encode() + b"\x00"
+    tiff = order + struct.pack(endian + "HI", 42, 8)
+    tiff += struct.pack(endian + "HHHII", 1, 0x8769, 4, 1, 26) + struct.pack(endian + "I", 0)
+    tiff += struct.pack(endian + "HHHII", 1, 0x9003, 2, len(value), 44) + struct.pack(endian + "I", 0)
+    return b"Exif\x00\x00" + tiff + value
+
+
+def make_jpeg(path, *segments):
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), (10, 120, 200)).save(buffer, "JPEG")
+    data = buffer.getvalue()
+    app1 = b"".join(b"\xff\xe1" + struct.pack(">H", len(segment) + 2) + segment for segment in segments)
+    path.write_bytes(data[:2] + app1 + data[2:])
+    return path
+
+
+XMP_SEGMENT = (b"http://ns.adobe.com/xap/1.0/\x00"
+               b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF/></x:xmpmeta>')
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+@pytest.mark.parametrize("xmp_first", [False, True])
+def test_fast_jpeg_datetime_reads_exif_segment(tmp_path, endian, xmp_first):
+    segments = [exif_segment(endian, "2014:05:13 16:53:20")]
+    if xmp_first:
+        segments.insert(0, XMP_SEGMENT)
+    image = make_jpeg(tmp_path / "photo.jpg", *segments)
+    assert arrange_photo._fast_jpeg_datetime(image) == "2014:05:13 16:53:20"
+    assert arrange_photo._pillow_datetime(image) == "2014:05:13 16:53:20"
+    assert arrange_photo.get_date_taken(image) == datetime(2014, 5, 13, 16, 53, 20)
+
+
+def test_fast_jpeg_datetime_without_exif(tmp_path):
+    image = make_jpeg(tmp_path / "photo.jpg", XMP_SEGMENT)
+    assert arrange_photo._fast_jpeg_datetime(image) is None
+    assert arrange_photo._pillow_datetime(image) is None
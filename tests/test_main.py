@@ -0,0 +1,239 @@
+import io
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+piexif = pytest.importorskip("piexif")
+from PIL import Image
+
+import main
+
+
+# Names as they appear in Google Takeout exports: (n) duplicates, edited copies,
+# camera timestamps, screenshots with spaces and dots, and truncated sidecars
+TAKEOUT_MEDIA = [
+    "IMG_20240101_123456.jpg",
+    "IMG_20240101_123456(1).jpg",
+    "IMG_20240101_123456-edited.jpg",
+    "IMG_20240101_123456_p.jpg",
+    "PXL_20240312_081530123.MP.jpg",
+    "PXL_20240312_081530123.MP(2).jpg",
+    "Screenshot 2024-01-05 10.20.30.png",
+    "Screenshot_2024-01-05 10.20.30(1).png",
+    "VID_20231231_235959.mp4",
+    "VID_20231231_235959~2.mp4",
+    "IMG-20240101-WA0001.jpg",
+    "IMG_1234.HEIC",
+    "IMG_1234(1).HEIC",
+    "image(3).png",
+    "trailing__.jpg",
+    " spaced  name .jpeg",
+    "Sömmer Fotó.jpg",
+    "unmatched.gif",
+]
+
+TAKEOUT_JSON = [
+    "IMG_20240101_123456.jpg.json",
+    "IMG_20240101_123456.jpg(1).json",
+    "IMG_20240101_123456.jpg.supplemental-metadata.json",
+    "PXL_20240312_081530123.MP.jpg.supplemental-me.json",
+    "Screenshot 2024-01-05 10.20.30.png.json",
+    "VID_20231231_235959.mp4.json",
+    "IMG-20240101-WA0001.jpg.json",
+    "IMG_1234.HEIC.json",
+    "IMG_1234.HEIC(1).json",
+    "image.png(3).json",
+    "trailing.jpg.json",
+    "spacedname.jpeg.json",
+    "Sömmer Fotó.jpg.json",
+]
+
+
+def baseline_normalize_filename(name):
+    # The regex-only implementation normalize_filename must stay equivalent to
+    name = re.sub(r"\(\d+\)", "", name)
+    name = re.sub(r"-edited$", "", name)
+    name = re.sub(r"_p$", "", name)
+    name = re.sub(r"(\d{4})-(\d{2})-(\d{2})\s+(\d{2})\.(\d{2})\.(\d{2})", r"\1\2\3_\4\5\6", name)
+    name = re.sub(r"\s+", "", name)
+    name = re.sub(r"\.", "", name)
+    name = re.sub(r"_+$", "", name)
+    return name
+
+
+def baseline_find_json_for_photo(photo_path, json_files):
+    # The linear scan find_json_for_photo replaced with an index; results must be identical
+    base_name = photo_path.stem
+    normalized_base = baseline_normalize_filename(base_name)
+    for json_file in json_files:
+        if json_file.stem.startswith(base_name):
+            return json_file
+    for json_file in json_files:
+        if baseline_normalize_filename(json_file.stem) == normalized_base:
+            return json_file
+    base_without_number = re.sub(r"\(\d+\)$", "", normalized_base)
+    for json_file in json_files:
+        json_base = baseline_normalize_filename(json_file.stem)
+        if re.sub(r"\(\d+\)$", "", json_base) == base_without_number:
+            return json_file
+    date_pattern = re.search(r"(\d{8}_\d{6})", normalized_base)
+    if date_pattern:
+        for json_file in json_files:
+            if date_pattern.group(1) in baseline_normalize_filename(json_file.stem):
+                return json_file
+    base_clean = re.sub(r"\(\d+\)|-\w+$|_\w+$", "", normalized_base)
+    for json_file in json_files:
+        json_base = baseline_normalize_filename(json_file.stem)
+        if re.sub(r"\(\d+\)|-\w+$|_\w+$", "", json_base) == base_clean:
+            return json_file
+    return None
+
+
+@pytest.mark.parametrize("name", TAKEOUT_MEDIA + TAKEOUT_JSON + [
+    "2024-01-05 10.20.30", "a-edited-edited", "x_p_p", "name(1)-edited", "dots...and  tabs\t", "___", ""])
+def test_normalize_filename_matches_baseline(name):
+    stem = os.path.splitext(name)[0]
+    assert main.normalize_filename(name) == baseline_normalize_filename(name)
+    assert main.normalize_filename(stem) == baseline_normalize_filename(stem)
+
+
+@pytest.mark.parametrize("order", [1, -1])
+def test_find_json_for_photo_matches_baseline(order):
+    json_files = [Path("src", name) for name in TAKEOUT_JSON[::order]]
+    json_index = main.build_json_index(json_files)
+    for name in TAKEOUT_MEDIA:
+        photo = Path("src", name)
+        assert main.find_json_for_photo(photo, json_index) == baseline_find_json_for_photo(photo, json_files), name
+
+
+def make_jpeg(path, **save_args):
+    image = Image.new("RGB", (32, 24), (200, 40, 90))
+    image.save(path, "JPEG", **save_args)
+    return path
+
+
+def test_process_media_file_writes_exif_to_jpeg(tmp_path):
+    src = tmp_path / "src"
+    output = tmp_path / "output"
+    src.mkdir()
+    output.mkdir()
+    media = make_jpeg(src / "IMG_0001.jpg")
+    with Image.open(media) as image:
+        original_pixels = image.tobytes()
+    json_file = src / "IMG_0001.jpg.json"
+    json_file.write_text(json.dumps({
+        "photoTakenTime": {"timestamp": "1400000000", "formatted": "May 13, 2014, 4:53:20 PM UTC"},
+        "geoData": {"latitude": 12.5, "longitude": -3.25},
+    }))
+
+    messages, processed = main.process_media_file(media, json_file, output)
+
+    assert processed
+    assert [level for level, _ in messages] == [logging.INFO]
+    assert not media.exists()
+    result = output / "1400000000_IMG_0001.jpg"
+    assert (output / "1400000000_IMG_0001.jpg.json").exists()
+    assert os.path.getmtime(result) == 1400000000
+
+    expected = datetime.fromtimestamp(1400000000).strftime("%Y:%m:%d %H:%M:%S").encode()
+    exif = piexif.load(str(result))
+    assert exif["Exif"][piexif.ExifIFD.DateTimeOriginal] == expected
+    assert exif["0th"][piexif.ImageIFD.DateTime] == expected
+    assert exif["GPS"][piexif.GPSIFD.GPSLatitude] == ((12, 1), (30, 1), (0, 1))
+    assert exif["GPS"][piexif.GPSIFD.GPSLongitudeRef] == b"W"
+    # The compressed image data is copied, not re-encoded
+    with Image.open(result) as image:
+        assert image.tobytes() == original_pixels
+
+
+@pytest.mark.parametrize("geo_data", [None, {"latitude": 0.0, "longitude": 0.0, "altitude": 0.0}])
+def test_process_media_file_keeps_existing_exif(tmp_path, geo_data):
+    src = tmp_path / "src"
+    output = tmp_path / "output"
+    src.mkdir()
+    output.mkdir()
+    camera_exif = piexif.dump({
+        "0th": {piexif.ImageIFD.Make: "Canon", piexif.ImageIFD.Orientation: 6},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: "2001:02:03 04:05:06", piexif.ExifIFD.ISOSpeedRatings: 200},
+    })
+    media = make_jpeg(src / "IMG_0002.jpg", exif=camera_exif)
+    metadata = {"photoTakenTime": {"timestamp": "1400000000"}}
+    if geo_data is not None:
+        metadata["geoData"] = geo_data
+    json_file = src / "IMG_0002.jpg.json"
+    json_file.write_text(json.dumps(metadata))
+
+    messages, processed = main.process_media_file(media, json_file, output)
+
+    assert processed
+    assert [level for level, _ in messages] == [logging.INFO]
+    expected = datetime.fromtimestamp(1400000000).strftime("%Y:%m:%d %H:%M:%S").encode()
+    exif = piexif.load(str(output / "1400000000_IMG_0002.jpg"))
+    assert exif["0th"][piexif.ImageIFD.Make] == b"Canon"
+    assert exif["0th"][piexif.ImageIFD.Orientation] == 6
+    assert exif["Exif"][piexif.ExifIFD.ISOSpeedRatings] == 200
+    assert exif["Exif"][piexif.ExifIFD.DateTimeOriginal] == expected
+    # No location in the metadata, so no GPS block either
+    assert exif["GPS"] == {}
+
+
+@pytest.mark.parametrize("save_args", [{}, {"exif": b"Exif\x00\x00MM\x00*\x00\x00\x00\x08\x00\x00\x00\x00\x00\x00"},
+                                       {"icc_profile": b"x" * 100}])
+def test_write_jpeg_with_exif_matches_piexif_insert(tmp_path, save_args):
+    src = make_jpeg(tmp_path / "src.jpg", **save_args)
+    dst = tmp_path / "dst.jpg"
+    exif_bytes = piexif.dump({"Exif": {piexif.ExifIFD.DateTimeOriginal: "2019:05:06 07:08:09"}})
+
+    main.write_jpeg_with_exif(src.read_bytes(), dst, exif_bytes)
+
+    expected = io.BytesIO()
+    piexif.insert(exif_bytes, src.read_bytes(), expected)
+    assert dst.read_bytes() == expected.getvalue()
+
+
+def test_process_photos_and_json_defers_json_cleanup(tmp_path, monkeypatch, caplog):
+    src = tmp_path / "src"
+    output = tmp_path / "output"
+    src.mkdir()
+    # Two copies share one sidecar; broken.mp4's worker fails outright
+    for name in ("VID_20231231_235959.mp4", "VID_20231231_235959(1).mp4", "broken.mp4"):
+        (src / name).write_bytes(name.encode())
+    for name in ("VID_20231231_235959.mp4.json", "broken.mp4.json"):
+        (src / name).write_text(json.dumps({"photoTakenTime": {"timestamp": "1400000000"}}))
+    inode = os.stat(src / "VID_20231231_235959.mp4").st_ino
+
+    # Threads stand in for worker processes so the worker can be replaced and observed
+    calls = []
+    process_media_file = main.process_media_file
+
+    def worker(media, json_file, output_dir):
+        calls.append((media.name, json_file.exists()))
+        if media.name == "broken.mp4":
+            raise RuntimeError("worker died")
+        return process_media_file(media, json_file, output_dir)
+
+    monkeypatch.setattr(main, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(main, "process_media_file", worker)
+
+    main.process_photos_and_json(src, src, output)
+
+    # Every worker still saw the shared JSON; it was deleted only after all of them finished
+    assert sorted(calls) == [("VID_20231231_235959(1).mp4", True), ("VID_20231231_235959.mp4", True),
+                             ("broken.mp4", True)]
+    assert "Error processing broken.mp4: worker died" in caplog.text
+    assert sorted(os.listdir(src)) == ["broken.mp4", "broken.mp4.json"]
+    assert sorted(os.listdir(output)) == [
+        "1400000000_VID_20231231_235959(1).mp4", "1400000000_VID_20231231_235959(1).mp4.json",
+        "1400000000_VID_20231231_235959.mp4", "1400000000_VID_20231231_235959.mp4.json",
+    ]
+    # Videos are moved rather than copied, and the sidecars are hard links to the one source file
+    assert os.stat(output / "1400000000_VID_20231231_235959.mp4").st_ino == inode
+    assert os.path.samefile(output / "1400000000_VID_20231231_235959.mp4.json",
+                            output / "1400000000_VID_20231231_235959(1).mp4.json")